@@ -1,4 +1,6 @@
-import antimony
+import os
+import hashlib
+import functools
 
 def get_antimony_model():
     return """
@@ -16,19 +18,37 @@ def get_antimony_model():
     end
     """
 
-def get_sbml_model():
+@functools.lru_cache(maxsize=8)
+def _antimony_to_sbml(src):
+    import antimony  # Imported lazily so cached runs skip it entirely
     antimony.clearPreviousLoads()
-    antimony.freeAll()
-    code = antimony.loadAntimonyString(get_antimony_model())
+    code = antimony.loadAntimonyString(src)
     if code >= 0:
         mid = antimony.getMainModuleName()
         sbml_model = antimony.getSBMLString(mid)
         return sbml_model
     raise Exception("Error in loading antimony model", code)
 
-# Write SBML to file
-sbml_str = get_sbml_model()
-with open("lotka_volterra.xml", "w") as f:
-    f.write(sbml_str)
+def get_sbml_model():
+    return _antimony_to_sbml(get_antimony_model())
+
+SBML_PATH = "lotka_volterra.xml"
+HASH_PATH = SBML_PATH + ".sha1"
+
+# Only regenerate SBML when the antimony source has changed
+model_hash = hashlib.sha1(get_antimony_model().encode()).hexdigest()
+cached_hash = None
+if os.path.exists(SBML_PATH) and os.path.exists(HASH_PATH):
+    with open(HASH_PATH, "r") as f:
+        cached_hash = f.read().strip()
 
-print("Lotka-Volterra model written to lotka_volterra.xml")
+if cached_hash == model_hash:
+    print(f"Lotka-Volterra model unchanged, using existing {SBML_PATH}")
+else:
+    # Write SBML to file
+    sbml_str = get_sbml_model()
+    with open(SBML_PATH, "w") as f:
+        f.write(sbml_str)
+    with open(HASH_PATH, "w") as f:
+        f.write(model_hash)
+    print(f"Lotka-Volterra model written to {SBML_PATH}")
@@ -1,40 +1,96 @@
 import os
+import sys
+import copy
 import yaml
 import dotenv
 import matplotlib.pyplot as plt
 import pickle
+import numpy as np
 import pandas as pd
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Prefer the libyaml-backed C loader/dumper, fall back to pure Python
+try:
+    from yaml import CSafeLoader as _Loader, CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeLoader as _Loader, SafeDumper as _Dumper
 
 dotenv.load_dotenv()
 new_path = os.getenv("DATA_PATH")
 
+# Parsed configs keyed by absolute path, validated against (mtime, size)
+_CACHE: OrderedDict[str, tuple[int, int, dict]] = OrderedDict()
+_CACHE_MAX = 100
+
+def _config_path(folder_name: str, config_suffix: str) -> str:
+    return os.path.abspath(os.path.join(new_path, folder_name, f"config_{config_suffix}.yml"))
+
+def _ensure_subdir(folder_name: str, sub: str) -> str:
+    # Only used by writers, creates the folder as well if needed
+    p = os.path.join(new_path, folder_name, sub)
+    os.makedirs(p, exist_ok=True)
+    return p
+
+def _nb(notebook_config: dict) -> tuple[str, str]:
+    # Folder name and config version, defaulting to 'v1' if not specified
+    return notebook_config['name'], notebook_config.get('version', 'v1')
+
+def _purge(path: str, prefix: str) -> None:
+    # Remove regular files in path whose name starts with prefix
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.name.startswith(prefix) and entry.is_file(follow_symlinks=False):
+                os.unlink(entry.path)
+
 def load_configs(folder_name: str, config_suffix: str = "v1") -> dict:
-    config_path = os.path.join(new_path, folder_name, f"config_{config_suffix}.yml")
-    with open(config_path, "r") as f:
-        config = yaml.safe_load(f)  # Use safe_load to prevent code execution
-    return config
+    config_path = _config_path(folder_name, config_suffix)
+    st = os.stat(config_path)
+    entry = _CACHE.get(config_path)
+    if entry is not None and entry[:2] == (st.st_mtime_ns, st.st_size):
+        _CACHE.move_to_end(config_path)
+        return copy.deepcopy(entry[2])  # Copy so callers can't mutate the cached config
+    with open(config_path, "rb") as f:  # Binary mode, let the parser detect the encoding
+        config = yaml.load(f, Loader=_Loader)  # Safe loader to prevent code execution
+    _CACHE[config_path] = (st.st_mtime_ns, st.st_size, config)
+    _CACHE.move_to_end(config_path)
+    if len(_CACHE) > _CACHE_MAX:
+        _CACHE.popitem(last=False)
+    return copy.deepcopy(config)
 
 def save_configs(folder_name: str, config: dict, config_suffix: str = "v1") -> None:
-    config_path = os.path.join(new_path, folder_name, f"config_{config_suffix}.yml")
-    with open(config_path, "w") as f:
-        yaml.dump(config, f, sort_keys=False)  # sort_keys=False to maintain order
+    config_path = _config_path(folder_name, config_suffix)
+    # Serialize before opening, so a config the dumper rejects doesn't truncate the file on disk
+    payload = yaml.dump(config, Dumper=_Dumper, sort_keys=False, encoding="utf-8", default_flow_style=False)  # sort_keys=False to maintain order
+    with open(config_path, "wb") as f:
+        f.write(payload)
+    _CACHE.pop(config_path, None)  # Next load re-parses what was actually written
         
 def initialise_config(folder_name: str, verbose: int = 0) -> None:
     '''
     Create a folder and set-up the initial experimental structure
     '''
     folder_path = os.path.join(new_path, folder_name)
-    # check if folder exists, if not create it
-    if not os.path.exists(folder_path):
-        os.makedirs(folder_path, exist_ok=True)
-        # make 'data' and 'figures' subfolders
-        os.makedirs(os.path.join(folder_path, 'data'), exist_ok=True)
-        os.makedirs(os.path.join(folder_path, 'figures'), exist_ok=True)
-        if verbose > 0:
+    # only stat the folder when we need to report whether it already existed
+    existed = verbose > 0 and os.path.isdir(folder_path)
+    # make 'data' and 'figures' subfolders, this also creates the folder itself
+    _ensure_subdir(folder_name, 'data')
+    _ensure_subdir(folder_name, 'figures')
+    if verbose > 0:
+        if existed:
+            print(f"Folder {folder_path} already exists.")
+        else:
             print(f"Created folder structure at {folder_path}")
-    else: 
-        if verbose > 0:
-            print(f"Folder {folder_path} already exists. No changes made.")
+
+def initialise_configs(folder_names: list[str], verbose: int = 0) -> None:
+    '''
+    Set-up the initial experimental structure for several folders at once.
+    Directory creation is I/O-bound, so the folders are created from a small thread pool.
+    '''
+    if not folder_names:
+        return
+    with ThreadPoolExecutor(max_workers=min(16, len(folder_names))) as ex:
+        list(ex.map(lambda name: initialise_config(name, verbose), folder_names))
         
     
 def save_figure(notebook_config: dict, fig: plt.Figure, fig_name: str, fig_format: str = "png", verbose: int = 0, **kwargs) -> None:
@@ -52,11 +108,8 @@ def save_figure(notebook_config: dict, fig: plt.Figure, fig_name: str, fig_forma
     **kwargs:
         Additional keyword arguments to pass to fig.savefig().
     '''
-    folder_name = notebook_config['name']
-    config_version = notebook_config.get('version', 'v1') # Default to 'v1' if not specified
-    figures_path = os.path.join(new_path, folder_name, 'figures')
-    if not os.path.exists(figures_path):
-        os.makedirs(figures_path, exist_ok=True)
+    folder_name, config_version = _nb(notebook_config)
+    figures_path = _ensure_subdir(folder_name, 'figures')
     fig_path = os.path.join(figures_path, f"{config_version}_{fig_name}.{fig_format}")
     fig.savefig(fig_path, format=fig_format, **kwargs)
     
@@ -64,7 +117,7 @@ def save_figure(notebook_config: dict, fig: plt.Figure, fig_name: str, fig_forma
         print(f"Figure saved at {fig_path}")
         
     
-def save_data(notebook_config: dict, data: any, data_name: str, data_format: str = 'pkl', verbose: int = 0, **kwargs) -> None:
+def save_data(notebook_config: dict, data: any, data_name: str, data_format: str = 'pkl', verbose: int = 0, out_of_band: bool = False, **kwargs) -> None:
     '''
     Saves data as a pickled file in the appropriate data folder.
     If the data is a pandas DataFrame and <1000 rows and columns, it is also saved as a CSV file.
@@ -76,25 +129,89 @@ def save_data(notebook_config: dict, data: any, data_name: str, data_format: str
         The data to be saved. Should have a 'to_csv' method if saving as CSV.
     data_name: str
         The name of the data file (without extension).
+    data_format: str
+        The format to save the data in ('pkl', 'csv', 'parquet' or 'feather'). For 'csv',
+        pass engine='pyarrow' to write DataFrames with pyarrow's CSV writer; only the 'index'
+        option is supported then, and frames pyarrow can't convert fall back to to_csv.
+        Note the output differs from to_csv: the header is quoted and whole-valued floats are
+        written without a decimal point (1.0 -> 1), so such columns load back as int64.
+        'parquet' and 'feather' require pyarrow and a DataFrame, and are written with zstd
+        compression.
+    out_of_band: bool
+        If True and saving as 'pkl', large array buffers are written to a separate
+        '.buffers.npz' file instead of being copied into the pickle stream.
+        Load the data back with load_data(..., out_of_band=True).
     **kwargs:
         Additional keyword arguments to pass to the data saving method.
     '''
-    folder_name = notebook_config['name']
-    config_version = notebook_config.get('version', 'v1') # Default to 'v1' if not specified
-    data_path = os.path.join(new_path, folder_name, 'data')
-    if not os.path.exists(data_path):
-        os.makedirs(data_path, exist_ok=True)
+    folder_name, config_version = _nb(notebook_config)
+    data_path = _ensure_subdir(folder_name, 'data')
     data_file_path = os.path.join(data_path, f"{config_version}_{data_name}.{data_format}")
     if data_format == 'pkl':
-        with open(data_file_path, 'wb') as f:
-            pickle.dump(data, f, **kwargs)
+        kwargs.setdefault('protocol', pickle.HIGHEST_PROTOCOL)
+        if out_of_band:
+            # Check before opening, so a bad protocol doesn't leave an empty file behind
+            protocol = kwargs['protocol']
+            if protocol is None:
+                protocol = pickle.DEFAULT_PROTOCOL
+            elif protocol < 0:
+                protocol = pickle.HIGHEST_PROTOCOL
+            if protocol < 5:
+                raise ValueError("out_of_band=True requires pickle protocol 5 or higher.")
+            buffers = []
+            with open(data_file_path, 'wb') as f:
+                pickle.dump(data, f, buffer_callback=buffers.append, **kwargs)
+            np.savez(data_file_path + '.buffers.npz', *[np.frombuffer(b.raw(), dtype=np.uint8) for b in buffers])
+        else:
+            with open(data_file_path, 'wb') as f:
+                pickle.dump(data, f, **kwargs)
     elif data_format == 'csv':
-        if hasattr(data, 'to_csv'):
+        if not hasattr(data, 'to_csv'):
+            raise ValueError("Data does not have a 'to_csv' method.")
+        tbl = None
+        if kwargs.pop('engine', None) == 'pyarrow':
+            try:
+                import pyarrow as pa
+                import pyarrow.csv as pa_csv
+            except ImportError:
+                raise ImportError("pyarrow is required for engine='pyarrow'.") from None
+            if not isinstance(data, pd.DataFrame):
+                raise ValueError("engine='pyarrow' only supports pandas DataFrames.")
+            unsupported = set(kwargs) - {'index'}
+            if unsupported:
+                raise ValueError(f"Unsupported options for engine='pyarrow': {sorted(unsupported)}")
+            try:
+                # Write the index as leading column(s), named like to_csv does
+                frame = data.reset_index(names=[n if n is not None else '' for n in data.index.names]) if kwargs.get('index', True) else data
+                tbl = pa.Table.from_pandas(frame, preserve_index=False)
+            except (pa.ArrowException, ValueError):
+                tbl = None  # e.g. mixed-type object columns, let pandas write them
+        if tbl is not None:
+            pa_csv.write_csv(tbl, data_file_path)
+        else:
             data.to_csv(data_file_path, **kwargs)
+    elif data_format in ('parquet', 'feather'):
+        try:
+            import pyarrow as pa
+            if data_format == 'parquet':
+                import pyarrow.parquet as pa_io
+            else:
+                import pyarrow.feather as pa_io
+        except ImportError:
+            raise ImportError(f"pyarrow is required to save data as '{data_format}'.") from None
+        if not isinstance(data, pd.DataFrame):
+            raise ValueError(f"Only pandas DataFrames can be saved as '{data_format}'.")
+        tbl = pa.Table.from_pandas(data)
+        if 'compression' not in kwargs:
+            kwargs['compression'] = 'zstd'
+            if data_format == 'parquet':
+                kwargs.setdefault('compression_level', 3)  # Only a sensible default for zstd
+        if data_format == 'parquet':
+            pa_io.write_table(tbl, data_file_path, **kwargs)
         else:
-            raise ValueError("Data does not have a 'to_csv' method.")
+            pa_io.write_feather(tbl, data_file_path, **kwargs)
     else:
-        raise ValueError("Unsupported data format. Use 'pkl' or 'csv'.")
+        raise ValueError("Unsupported data format. Use 'pkl', 'csv', 'parquet' or 'feather'.")
     
     if verbose > 0:
         print(f"Data saved at {data_file_path}")
@@ -118,37 +235,41 @@ def clear_data_and_figure(notebook_config: dict, data: bool = True, figure: bool
             print("No action taken. Both data and figure flags are set to False.")
         return
     
-    folder_name = notebook_config['name']
-    config_version = notebook_config.get('version', 'v1') # Default to 'v1' if not specified
+    folder_name, config_version = _nb(notebook_config)
+    
+    prefix = config_version + "_"
     
     # Clear data files
     data_path = os.path.join(new_path, folder_name, 'data')
-    if os.path.exists(data_path):
-        for file in os.listdir(data_path):
-            if file.startswith(config_version + "_"):
-                os.remove(os.path.join(data_path, file))
+    if data and os.path.exists(data_path):
+        _purge(data_path, prefix)
         if verbose > 0:
             print(f"Cleared data files for version {config_version} in {data_path}")
     
     # Clear figure files
     figures_path = os.path.join(new_path, folder_name, 'figures')
-    if os.path.exists(figures_path):
-        for file in os.listdir(figures_path):
-            if file.startswith(config_version + "_"):
-                os.remove(os.path.join(figures_path, file))
+    if figure and os.path.exists(figures_path):
+        _purge(figures_path, prefix)
         if verbose > 0:
             print(f"Cleared figure files for version {config_version} in {figures_path}")
             
 def print_config(d, indent=0):
-    for key, value in d.items():
-        print(" " * indent + str(key) + ":", end=" ")
-        if isinstance(value, dict):
-            print()
-            print_config(value, indent + 2)
+    # Walk nested dicts with an explicit stack and emit everything in one write
+    buf = []
+    stack = [(iter(d.items()), indent)]
+    while stack:
+        items, level = stack[-1]
+        for key, value in items:
+            if isinstance(value, dict):
+                buf.append(" " * level + str(key) + ": \n")
+                stack.append((iter(value.items()), level + 2))
+                break
+            buf.append(" " * level + str(key) + ": " + str(value) + "\n")
         else:
-            print(str(value))
+            stack.pop()
+    sys.stdout.write("".join(buf))
 
-def load_data(notebook_config: dict, data_name: str, data_format: str = 'pkl', verbose: int = 0, **kwargs) -> any:
+def load_data(notebook_config: dict, data_name: str, data_format: str = 'pkl', verbose: int = 0, out_of_band: bool = False, **kwargs) -> any:
     '''
     Loads data from the appropriate data folder.
     notebook_config: dict
@@ -158,14 +279,17 @@ def load_data(notebook_config: dict, data_name: str, data_format: str = 'pkl', v
     data_name: str
         The name of the data file (without extension).
     data_format: str
-        The format of the data file ('pkl' or 'csv').
+        The format of the data file ('pkl', 'csv', 'parquet' or 'feather'). For 'csv', pass
+        engine='pyarrow' to read with pandas' pyarrow engine. 'parquet' and 'feather' require
+        pyarrow.
+    out_of_band: bool
+        Set to True for pickles saved with save_data(..., out_of_band=True).
     **kwargs:
         Additional keyword arguments to pass to the data loading method.
     Returns:
         The loaded data.
     '''
-    folder_name = notebook_config['name']
-    config_version = notebook_config.get('version', 'v1') # Default to 'v1' if not specified
+    folder_name, config_version = _nb(notebook_config)
     data_path = os.path.join(new_path, folder_name, 'data')
     data_file_path = os.path.join(data_path, f"{config_version}_{data_name}.{data_format}")
     
@@ -173,12 +297,24 @@ def load_data(notebook_config: dict, data_name: str, data_format: str = 'pkl', v
         raise FileNotFoundError(f"Data file not found: {data_file_path}")
     
     if data_format == 'pkl':
+        if out_of_band:
+            with np.load(data_file_path + '.buffers.npz') as npz:
+                kwargs['buffers'] = [npz[f'arr_{i}'] for i in range(len(npz.files))]
         with open(data_file_path, 'rb') as f:
             data = pickle.load(f, **kwargs)
     elif data_format == 'csv':
         data = pd.read_csv(data_file_path, **kwargs)
+    elif data_format in ('parquet', 'feather'):
+        try:
+            if data_format == 'parquet':
+                import pyarrow.parquet as pa_io
+            else:
+                import pyarrow.feather as pa_io
+        except ImportError:
+            raise ImportError(f"pyarrow is required to load '{data_format}' data.") from None
+        data = pa_io.read_table(data_file_path, **kwargs).to_pandas()
     else:
-        raise ValueError("Unsupported data format. Use 'pkl' or 'csv'.")
+        raise ValueError("Unsupported data format. Use 'pkl', 'csv', 'parquet' or 'feather'.")
     
     if verbose > 0:
         print(f"Data loaded from {data_file_path}")